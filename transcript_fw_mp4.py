@@ -1,81 +1,37 @@
 import os
 import sys
+import subprocess
+import glob
 import time
 import argparse
+import multiprocessing
 from pathlib import Path
-from faster_whisper import WhisperModel
 from tqdm import tqdm
+from transcript_utils import COMPUTE_TYPE_HELP, default_compute_type, ensure_wav, write_outputs_streaming
 
-def ms_to_srt_time(milliseconds):
-    """Convert milliseconds to SRT format (HH:MM:SS,mmm)"""
-    seconds = milliseconds / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-def ms_to_vtt_time(milliseconds):
-    """Convert milliseconds to VTT format (HH:MM.mmm)"""
-    seconds = milliseconds / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}.{millis:03d}" if hours > 0 else f"{minutes:02d}:{secs:02d}.{millis:03d}"
-
-def save_txt(segments, filename):
-    """Save plain text transcription"""
-    with open(filename, 'w') as f:
-        for segment in segments:
-            f.write(segment.text.strip() + " ")
-    print(f"Saved {filename}")
-
-def save_tsv(segments, filename):
-    """Save Tab-Separated Values with timestamps in milliseconds"""
-    with open(filename, 'w') as f:
-        f.write("start\tend\ttext\n")
-        for segment in segments:
-            start_ms = int(segment.start * 1000)
-            end_ms = int(segment.end * 1000)
-            text = segment.text.strip()
-            f.write(f"{start_ms}\t{end_ms}\t{text}\n")
-    print(f"Saved {filename}")
-
-def save_srt(segments, filename):
-    """Save SubRip subtitle format"""
-    with open(filename, 'w') as f:
-        for i, segment in enumerate(segments, 1):
-            start_time = ms_to_srt_time(int(segment.start * 1000))
-            end_time = ms_to_srt_time(int(segment.end * 1000))
-            text = segment.text.strip()
-            f.write(f"{i}\n{start_time} --> {end_time}\n{text}\n\n")
-    print(f"Saved {filename}")
-
-def save_vtt(segments, filename):
-    """Save WebVTT subtitle format"""
-    with open(filename, 'w') as f:
-        f.write("WEBVTT\n\n")
-        for segment in segments:
-            start_time = ms_to_vtt_time(int(segment.start * 1000))
-            end_time = ms_to_vtt_time(int(segment.end * 1000))
-            text = segment.text.strip()
-            f.write(f"{start_time} --> {end_time}\n{text}\n\n")
-    print(f"Saved {filename}")
+def collect_inputs(input_arg):
+    """Resolve a file, a directory of MP4s or a glob pattern to a list of input paths
 
-def main():
-    parser = argparse.ArgumentParser(description="Transcribe MP4 files using faster-whisper")
-    parser.add_argument("input", help="Path to the input MP4 file")
-    parser.add_argument("--model", default="large-v3", help="Whisper model to use (default: large-v3)")
-    parser.add_argument("--device", default="cuda", help="Device to use (cuda or cpu)")
-    parser.add_argument("--compute_type", default="float16", help="Compute type (float16, int8_float16, int8, etc.)")
-    args = parser.parse_args()
+    Directory scanning only picks up files with a lowercase .mp4 extension.
+    """
+    input_path = Path(input_arg)
+    if input_path.is_dir():
+        return sorted(input_path.glob("*.mp4"))
+    if input_path.exists():
+        return [input_path]
+    return sorted(Path(p) for p in glob.glob(input_arg))
 
-    input_path = Path(args.input)
-    if not input_path.exists():
-        print(f"Error: File '{input_path}' not found!")
-        sys.exit(1)
+def visible_gpus():
+    """Return the CUDA device indices visible to this process"""
+    cuda_visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if cuda_visible is not None:
+        # Indices are relative to the visible set, not the physical GPU ids
+        return list(range(len([d for d in cuda_visible.split(",") if d.strip()])))
+    import ctranslate2
+    return list(range(ctranslate2.get_cuda_device_count()))
 
+def transcribe_file(model, input_path, args, position=0):
+    """Transcribe a single file, streaming all output formats into its output directory"""
     # Create output directory: input_transcribed
     output_dir = input_path.parent / f"{input_path.stem}_transcribed"
     output_dir.mkdir(exist_ok=True)
@@ -83,39 +39,137 @@ def main():
     # Base filename for output files inside the directory
     base_name = input_path.stem
 
-    print(f"Loading model {args.model} on {args.device} ({args.compute_type})...")
-    model = WhisperModel(args.model, device=args.device, compute_type=args.compute_type)
-    
+    # Optionally extract audio to disk once so later runs skip the video demux
+    audio_source = input_path
+    if args.extract_wav:
+        try:
+            audio_source = ensure_wav(input_path, output_dir / f"{base_name}.16k.wav")
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Error during audio extraction: {e.stderr.decode()}") from e
+
     print(f"Transcribing {input_path}...")
     start_time = time.time()
-    
-    segments, info = model.transcribe(str(input_path), beam_size=5)
-    
+
+    vad_parameters = dict(min_silence_duration_ms=500) if args.vad_filter else None
+    segments, info = model.transcribe(str(audio_source), beam_size=args.beam_size,
+                                      vad_filter=args.vad_filter, vad_parameters=vad_parameters)
+
     # Use tqdm for progress bar based on audio duration
     # Using {n_fmt} and {total_fmt} is safer than {n:.2f} and {total:.2f} to avoid NoneType formatting errors
     duration = info.duration if info.duration is not None else 0
-    pbar = tqdm(total=round(duration, 2), unit="s", desc="Transcription Progress", bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
-    
-    all_segments = []
-    for segment in segments:
-        all_segments.append(segment)
+    pbar = tqdm(total=round(duration, 2), unit="s", desc="Transcription Progress", position=position, mininterval=1.0, miniters=10, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
+
+    def on_segment(i, segment, start_srt, end_srt):
         seg_end = segment.end if segment.end is not None else 0
         pbar.update(round(seg_end, 2) - pbar.n)
+
+    # Write all formats in a single pass as segments are decoded
+    write_outputs_streaming(segments, output_dir, base_name, on_segment=on_segment)
     pbar.close()
-    
+
     end_time = time.time()
     execution_time = end_time - start_time
 
-    # Generate all output formats in the output directory
-    save_txt(all_segments, output_dir / f"{base_name}.txt")
-    save_tsv(all_segments, output_dir / f"{base_name}.tsv")
-    save_srt(all_segments, output_dir / f"{base_name}.srt")
-    save_vtt(all_segments, output_dir / f"{base_name}.vtt")
-
     print(f"\nTranscription complete! Files saved in {output_dir}")
     print(f"Audio duration: {info.duration:.2f} seconds")
+    if args.vad_filter:
+        print(f"Speech after VAD: {info.duration_after_vad:.2f} seconds")
     print(f"Transcription time: {execution_time:.2f} seconds")
     print(f"Speedup: {info.duration / execution_time:.2f}x")
 
+def try_transcribe_file(model, input_path, args, position=0, label=""):
+    """Transcribe a file, reporting any error instead of raising; return True on success"""
+    try:
+        transcribe_file(model, input_path, args, position=position)
+        return True
+    except Exception as e:
+        print(f"{label}Error transcribing {input_path}: {e}")
+        return False
+
+def gpu_worker(device_index, position, queue, args):
+    """Load a model on one GPU and transcribe files from the queue until a None sentinel arrives"""
+    from faster_whisper import WhisperModel
+
+    print(f"[GPU {device_index}] Loading model {args.model} ({args.compute_type})...")
+    model = WhisperModel(args.model, device="cuda", device_index=device_index, compute_type=args.compute_type)
+    failed = 0
+    while True:
+        input_path = queue.get()
+        if input_path is None:
+            break
+        if not try_transcribe_file(model, Path(input_path), args, position=position, label=f"[GPU {device_index}] "):
+            failed += 1
+    # A non-zero exit code tells main() that some of this worker's files failed
+    sys.exit(1 if failed else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe MP4 files using faster-whisper")
+    parser.add_argument("input", help="Path to an input MP4 file, a directory of MP4 files (lowercase .mp4 only) or a glob pattern")
+    parser.add_argument("--model", default="large-v3", help="Whisper model to use (default: large-v3)")
+    parser.add_argument("--device", default="cuda", help="Device to use (cuda or cpu)")
+    parser.add_argument("--compute_type", default=None, help=COMPUTE_TYPE_HELP)
+    parser.add_argument("--beam_size", type=int, default=1,
+                        help="Beam size for decoding (default: 1, greedy). A beam of 5 can lower WER slightly "
+                             "(~0.1-0.3 absolute) but makes decoding 3-4x slower")
+    parser.add_argument("--vad_filter", action=argparse.BooleanOptionalAction, default=True,
+                        help="Skip silent regions with Silero VAD before decoding (default: enabled)")
+    parser.add_argument("--extract_wav", action="store_true",
+                        help="Extract 16kHz mono WAV with ffmpeg into the output directory and reuse it on later runs")
+    parser.add_argument("--gpus", default=None,
+                        help="Comma-separated CUDA device indices to spread input files across (default: all visible GPUs)")
+    args = parser.parse_args()
+
+    if args.compute_type is None:
+        args.compute_type = default_compute_type(args.device)
+
+    input_paths = collect_inputs(args.input)
+    if not input_paths:
+        if Path(args.input).is_dir():
+            print(f"Error: No .mp4 files found in directory '{args.input}'!")
+        else:
+            print(f"Error: No files found for '{args.input}'!")
+        sys.exit(1)
+
+    gpus = [0]
+    if args.device == "cuda":
+        gpus = [int(g) for g in args.gpus.split(",")] if args.gpus else visible_gpus() or [0]
+
+    if len(gpus) == 1 or len(input_paths) == 1:
+        # Imported here so --help and bad paths don't pay for loading CTranslate2/CUDA
+        from faster_whisper import WhisperModel
+
+        print(f"Loading model {args.model} on {args.device} ({args.compute_type})...")
+        model = WhisperModel(args.model, device=args.device, device_index=gpus[0], compute_type=args.compute_type)
+        failed = [p for p in input_paths if not try_transcribe_file(model, p, args)]
+        if failed:
+            print(f"\n{len(failed)} of {len(input_paths)} files failed")
+            sys.exit(1)
+        return
+
+    # One worker process per GPU, each with its own model, draining a shared queue of files
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    workers = gpus[:len(input_paths)]
+    for input_path in input_paths:
+        queue.put(str(input_path))
+    for _ in workers:
+        queue.put(None)
+
+    print(f"Transcribing {len(input_paths)} files on GPUs {', '.join(map(str, workers))}...")
+    processes = [
+        ctx.Process(target=gpu_worker, args=(device_index, position, queue, args))
+        for position, device_index in enumerate(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # Workers exit non-zero if any of their files failed, or if they crashed (e.g. model load or OOM)
+    failed_gpus = [device_index for device_index, process in zip(workers, processes) if process.exitcode != 0]
+    if failed_gpus:
+        print(f"\nTranscription failed on GPUs {', '.join(map(str, failed_gpus))}; see errors above")
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
@@ -1,50 +1,51 @@
 import os
 import sys
 import time
+import atexit
 import argparse
 import logging
 from pathlib import Path
-from faster_whisper import WhisperModel
 from tqdm import tqdm
+import numpy as np
 import pynvml
+from transcript_utils import COMPUTE_TYPE_HELP, default_compute_type, load_audio, write_outputs_streaming
+
+# Poll GPU temperature/load every N segments; it does not change segment-to-segment
+GPU_CHECK_INTERVAL = 10
+# Recompute the efficiency postfix every N segments
+PROGRESS_INTERVAL = 10
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
 class TqdmLoggingHandler(logging.Handler):
-    def __init__(self, level=logging.NOTSET):
+    def __init__(self, level=logging.NOTSET, stream=None):
         super().__init__(level)
+        self.stream = stream
 
     def emit(self, record):
         try:
             msg = self.format(record)
-            tqdm.write(msg)
+            tqdm.write(msg, file=self.stream)
             self.flush()
         except Exception:
             self.handleError(record)
 
-def ms_to_srt_time(milliseconds):
-    """Convert milliseconds to SRT format (HH:MM:SS,mmm)"""
-    seconds = milliseconds / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-def ms_to_vtt_time(milliseconds):
-    """Convert milliseconds to VTT format (HH:MM.mmm)"""
-    seconds = milliseconds / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}.{millis:03d}" if hours > 0 else f"{minutes:02d}:{secs:02d}.{millis:03d}"
-
-def check_gpu_and_pause(temp_threshold=55, load_threshold=70, pause_time=120):
+def init_gpu_monitor(device_index=0):
+    """Initialize NVML once and return the device handle, or None if unavailable"""
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        return None
+    atexit.register(pynvml.nvmlShutdown)
+    try:
+        return pynvml.nvmlDeviceGetHandleByIndex(device_index)
+    except pynvml.NVMLError:
+        return None
+
+def check_gpu_and_pause(handle, temp_threshold=55, load_threshold=70, pause_time=120):
     """Check GPU status and pause if thresholds are exceeded"""
     logger = logging.getLogger(__name__)
     try:
-        pynvml.nvmlInit()
-        handle = pynvml.nvmlDeviceGetHandleByIndex(0) # Assuming GPU 0
-        
         while True:
             temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
             util = pynvml.nvmlDeviceGetUtilizationRates(handle)
@@ -57,138 +58,208 @@ def check_gpu_and_pause(temp_threshold=55, load_threshold=70, pause_time=120):
     except pynvml.NVMLError as e:
         # If NVML fails, we just continue to avoid breaking the transcription
         pass
+
+def start_transcription(model, batched_model, audio, args, vad_filter=None):
+    """Start decoding through the batched pipeline when available, otherwise sequentially"""
+    vad_filter = args.vad_filter if vad_filter is None else vad_filter
+    vad_parameters = dict(min_silence_duration_ms=500) if vad_filter else None
+    if batched_model is not None:
+        # Batched decoding splits the audio into VAD windows and decodes them together
+        # without_timestamps=False keeps sentence-level cues instead of one cue per (up to 30s) window
+        return batched_model.transcribe(audio, batch_size=args.batch_size, beam_size=args.beam_size,
+                                        without_timestamps=False,
+                                        vad_filter=vad_filter, vad_parameters=vad_parameters)
+    return model.transcribe(audio, beam_size=args.beam_size,
+                            vad_filter=vad_filter, vad_parameters=vad_parameters)
+
+def transcribe_file(model, batched_model, input_path, output_dir, args, gpu_handle=None):
+    """Transcribe one file into output_dir and return the elapsed time in seconds"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Base filename for output files inside the directory
+    base_name = input_path.stem
+    log_file = output_dir / f"{base_name}.log"
+
+    # Each file gets its own log next to its outputs
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(file_handler)
+    logger = logging.getLogger(__name__)
+
+    try:
+        logger.info(f"Model {args.model} on {args.device} ({args.compute_type})")
+        logger.info(f"Transcribing {input_path}...")
+        start_time = time.time()
+
+        # Decode the audio once up front so the container is not parsed again by the model
+        cache_path = output_dir / f"{base_name}_16k.npy" if args.cache_audio else None
+        audio = load_audio(input_path, cache_path=cache_path)
+
+        segments, info = start_transcription(model, batched_model, audio, args)
+
+        logger.info(f"Audio duration: {info.duration:.2f} seconds ({info.duration/60:.2f} minutes)")
+        if args.vad_filter and info.duration:
+            logger.info(f"Speech after VAD: {info.duration_after_vad:.2f} seconds "
+                        f"({100 * (1 - info.duration_after_vad / info.duration):.1f}% skipped as silence)")
+
+        # Use tqdm for progress bar based on audio duration
+        # mininterval/miniters coalesce redraws to about once per second (miniters is in audio seconds)
+        # Using {n_fmt} and {total_fmt} is safer than {n:.2f} and {total:.2f} to avoid NoneType formatting errors
+        duration = info.duration if info.duration is not None else 0
+        pbar = tqdm(
+            total=round(duration, 2), 
+            unit="s", 
+            desc="Transcription Progress", 
+            bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]',
+            mininterval=1.0,
+            miniters=10,
+            leave=True
+        )
+    
+        def on_segment(i, segment, start_srt, end_srt):
+            # Thermal protection check every GPU_CHECK_INTERVAL-th segment
+            if gpu_handle is not None and (i - 1) % GPU_CHECK_INTERVAL == 0:
+                check_gpu_and_pause(
+                    gpu_handle,
+                    temp_threshold=args.temp_limit, 
+                    load_threshold=args.load_limit,
+                    pause_time=args.pause_time
+                )
+
+            # Log segment to file and terminal (DEBUG level)
+            logger.debug(f"[{start_srt} -> {end_srt}] {segment.text.strip()}")
+
+            # Update progress and efficiency
+            # Efficiency is calculated as (processed audio duration) / (actual time elapsed)
+            seg_end = segment.end if segment.end is not None else 0
+            if i % PROGRESS_INTERVAL == 0:
+                current_elapsed = time.time() - start_time
+                efficiency = seg_end / current_elapsed if current_elapsed > 0 else 0
+                # refresh=False leaves the redraw to the next throttled update()
+                pbar.set_postfix(eff=f"{efficiency:.2f}x", refresh=False)
+            pbar.update(round(seg_end, 2) - pbar.n)
+
+        # Write all formats incrementally as segments are decoded
+        write_outputs_streaming(segments, output_dir, base_name, on_segment=on_segment)
+
+        pbar.close()
+
+        end_time = time.time()
+        elapsed = end_time - start_time
+        speedup = info.duration / elapsed
+
+        logger.info(f"\nTranscription completed in {elapsed:.2f} seconds.")
+        logger.info(f"Audio duration: {info.duration:.2f} seconds.")
+        logger.info(f"Speedup: {speedup:.2f}x")
+        logger.info(f"Outputs saved in: {output_dir}")
+        return elapsed
     finally:
-        try:
-            pynvml.nvmlShutdown()
-        except:
+        logging.getLogger().removeHandler(file_handler)
+        file_handler.close()
+
+def warm_up(model, batched_model, args):
+    """Run the request decode path on a second of silence so VAD, kernels and allocator pools are set up early"""
+    audio = np.zeros(16000, dtype=np.float32)
+    # VAD finds no speech in silence, so the clip is also decoded once without VAD to exercise the encoder/decoder
+    for vad_filter in ([True, False] if args.vad_filter else [False]):
+        segments, _ = start_transcription(model, batched_model, audio, args, vad_filter=vad_filter)
+        for _ in segments:
             pass
 
+def serve(model, batched_model, args, gpu_handle=None):
+    """Transcribe 'input_path<TAB>output_dir' requests from stdin with the already loaded model"""
+    logger = logging.getLogger(__name__)
+    logger.info("Warming up model...")
+    warm_up(model, batched_model, args)
+    logger.info("Ready for requests on stdin")
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        fields = line.split("\t")
+        input_path = Path(fields[0])
+        output_dir = Path(fields[1]) if len(fields) > 1 and fields[1] else input_path.parent / f"{input_path.stem}_transcribed"
+        if not input_path.exists():
+            logger.error(f"File '{input_path}' not found!")
+            print(f"ERR\t{input_path}", flush=True)
+            continue
+        try:
+            elapsed = transcribe_file(model, batched_model, input_path, output_dir, args, gpu_handle)
+            print(f"OK\t{input_path}\t{elapsed:.2f}", flush=True)
+        except Exception:
+            logger.exception(f"Failed to transcribe {input_path}")
+            print(f"ERR\t{input_path}", flush=True)
+
 def main():
     parser = argparse.ArgumentParser(description="Transcribe MP4 files using faster-whisper with GPU thermal protection")
-    parser.add_argument("input", help="Path to the input MP4 file")
+    parser.add_argument("input", nargs="?", help="Path to the input MP4 file (omit with --serve)")
     parser.add_argument("--model", default="large-v3", help="Whisper model to use (default: large-v3)")
     parser.add_argument("--device", default="cuda", help="Device to use (cuda or cpu)")
-    parser.add_argument("--compute_type", default="float16", help="Compute type (float16, int8_float16, int8, etc.)")
+    parser.add_argument("--compute_type", default=None, help=COMPUTE_TYPE_HELP)
+    parser.add_argument("--beam_size", type=int, default=1,
+                        help="Beam size for decoding (default: 1, greedy). A beam of 5 can lower WER slightly "
+                             "(~0.1-0.3 absolute) but makes decoding 3-4x slower")
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help="Number of VAD-split audio windows decoded together on the GPU (default: 16). "
+                             "Subtitle cues keep sentence-level timestamps, but each window is decoded independently "
+                             "so cue boundaries can differ slightly from sequential decoding and a sentence crossing "
+                             "a window edge is split. Batched decoding only uses the first temperature, so unlike "
+                             "sequential decoding it never retries hard windows at a higher temperature. "
+                             "Use 1 for sequential decoding")
+    parser.add_argument("--vad_filter", action=argparse.BooleanOptionalAction, default=True,
+                        help="Skip silent regions with Silero VAD before decoding (default: enabled)")
+    parser.add_argument("--cache_audio", action="store_true",
+                        help="Keep the decoded 16kHz audio as <name>_16k.npy in the output directory and reuse it on later runs")
     parser.add_argument("--temp_limit", type=int, default=55, help="Temperature threshold to pause (default: 55)")
     parser.add_argument("--load_limit", type=int, default=70, help="Utilization threshold to pause (default: 70)")
     parser.add_argument("--pause_time", type=int, default=120, help="Seconds to pause when thresholds exceeded (default: 120)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Load the model once, then read 'input_path<TAB>output_dir' lines from stdin and answer "
+                             "each with 'OK<TAB>input_path<TAB>seconds' or 'ERR<TAB>input_path' on stdout")
     args = parser.parse_args()
 
-    input_path = Path(args.input)
-    if not input_path.exists():
-        print(f"Error: File '{input_path}' not found!")
-        sys.exit(1)
-
-    # Create output directory: input_transcribed
-    output_dir = input_path.parent / f"{input_path.stem}_transcribed"
-    output_dir.mkdir(exist_ok=True)
+    if args.compute_type is None:
+        args.compute_type = default_compute_type(args.device)
 
-    # Base filename for output files inside the directory
-    base_name = input_path.stem
-    log_file = output_dir / f"{base_name}.log"
+    if not args.serve:
+        if args.input is None:
+            parser.error("the input argument is required unless --serve is given")
+        input_path = Path(args.input)
+        if not input_path.exists():
+            print(f"Error: File '{input_path}' not found!")
+            sys.exit(1)
 
-    # Configure logging
+    # Configure logging; per-file log handlers are added in transcribe_file
+    # In serve mode stdout carries the request/response protocol, so log to stderr
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            TqdmLoggingHandler()
-        ]
+        format=LOG_FORMAT,
+        handlers=[TqdmLoggingHandler(stream=sys.stderr if args.serve else None)]
     )
     logger = logging.getLogger(__name__)
 
+    # Imported here so --help and bad paths don't pay for loading CTranslate2/CUDA
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
     logger.info(f"Loading model {args.model} on {args.device} ({args.compute_type})...")
     model = WhisperModel(args.model, device=args.device, compute_type=args.compute_type)
-    
-    logger.info(f"Transcribing {input_path}...")
-    start_time = time.time()
-    
-    segments, info = model.transcribe(str(input_path), beam_size=5)
-    
-    logger.info(f"Audio duration: {info.duration:.2f} seconds ({info.duration/60:.2f} minutes)")
-
-    # Use tqdm for progress bar based on audio duration
-    # dynamic_ncols=True ensures the bar refreshes on the same line by adapting to terminal width
-    # Using {n_fmt} and {total_fmt} is safer than {n:.2f} and {total:.2f} to avoid NoneType formatting errors
-    duration = info.duration if info.duration is not None else 0
-    pbar = tqdm(
-        total=round(duration, 2), 
-        unit="s", 
-        desc="Transcription Progress", 
-        bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]',
-        dynamic_ncols=True,
-        leave=True
-    )
-    
-    # Open files for incremental writing
-    txt_path = output_dir / f"{base_name}.txt"
-    tsv_path = output_dir / f"{base_name}.tsv"
-    srt_path = output_dir / f"{base_name}.srt"
-    vtt_path = output_dir / f"{base_name}.vtt"
-
-    with open(txt_path, 'w', encoding='utf-8') as txt_f, \
-         open(tsv_path, 'w', encoding='utf-8') as tsv_f, \
-         open(srt_path, 'w', encoding='utf-8') as srt_f, \
-         open(vtt_path, 'w', encoding='utf-8') as vtt_f:
-        
-        tsv_f.write("start\tend\ttext\n")
-        vtt_f.write("WEBVTT\n\n")
-        
-        for i, segment in enumerate(segments, 1):
-            # Thermal protection check before processing each segment
-            if args.device == "cuda":
-                check_gpu_and_pause(
-                    temp_threshold=args.temp_limit, 
-                    load_threshold=args.load_limit,
-                    pause_time=args.pause_time
-                )
-            
-            text = segment.text.strip()
-            start_ms = int(segment.start * 1000)
-            end_ms = int(segment.end * 1000)
-
-            # Write to TXT
-            txt_f.write(text + " ")
-            txt_f.flush()
-
-            # Write to TSV
-            tsv_f.write(f"{start_ms}\t{end_ms}\t{text}\n")
-            tsv_f.flush()
-
-            # Write to SRT
-            start_srt = ms_to_srt_time(start_ms)
-            end_srt = ms_to_srt_time(end_ms)
-            srt_f.write(f"{i}\n{start_srt} --> {end_srt}\n{text}\n\n")
-            srt_f.flush()
-
-            # Write to VTT
-            start_vtt = ms_to_vtt_time(start_ms)
-            end_vtt = ms_to_vtt_time(end_ms)
-            vtt_f.write(f"{start_vtt} --> {end_vtt}\n{text}\n\n")
-            vtt_f.flush()
+    # Batched decoding relies on VAD to cut the audio into windows
+    batched_model = None
+    if args.batch_size > 1 and args.vad_filter:
+        batched_model = BatchedInferencePipeline(model=model)
+    elif args.batch_size > 1:
+        logger.warning("Batched decoding needs --vad_filter; falling back to sequential decoding")
 
-            # Log segment to file and terminal (DEBUG level)
-            logger.debug(f"[{ms_to_srt_time(start_ms)} -> {ms_to_srt_time(end_ms)}] {text}")
+    # NVML is initialized once here; the per-segment check only reads sensors
+    gpu_handle = init_gpu_monitor() if args.device == "cuda" else None
 
-            # Update progress and efficiency
-            # Efficiency is calculated as (processed audio duration) / (actual time elapsed)
-            current_elapsed = time.time() - start_time
-            seg_end = segment.end if segment.end is not None else 0
-            efficiency = seg_end / current_elapsed if current_elapsed > 0 else 0
-            pbar.set_postfix(eff=f"{efficiency:.2f}x")
-            pbar.update(round(seg_end, 2) - pbar.n)
-    
-    pbar.close()
-    
-    end_time = time.time()
-    elapsed = end_time - start_time
-    speedup = info.duration / elapsed
-    
-    logger.info(f"\nTranscription completed in {elapsed:.2f} seconds.")
-    logger.info(f"Audio duration: {info.duration:.2f} seconds.")
-    logger.info(f"Speedup: {speedup:.2f}x")
-    logger.info(f"Outputs saved in: {output_dir}")
+    if args.serve:
+        serve(model, batched_model, args, gpu_handle)
+        return
+
+    # Create output directory: input_transcribed
+    output_dir = input_path.parent / f"{input_path.stem}_transcribed"
+    transcribe_file(model, batched_model, input_path, output_dir, args, gpu_handle)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,188 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Flush streamed output files every N segments so partial results survive a crash
+FLUSH_INTERVAL = 50
+
+COMPUTE_TYPE_HELP = ("Compute type (float16, int8_float16, int8, etc.). Defaults to int8_float16 on cuda "
+                     "(int8 weights with fp16 activations: roughly half the VRAM and faster decoding than "
+                     "float16 with negligible accuracy loss) and int8 on cpu")
+
+def default_compute_type(device):
+    """Pick the CTranslate2 compute type used when --compute_type is not given"""
+    return "int8_float16" if device == "cuda" else "int8"
+
+def ms_to_srt_time(milliseconds):
+    """Convert milliseconds to SRT format (HH:MM:SS,mmm)"""
+    seconds = milliseconds / 1000
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int(milliseconds % 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+def segments_to_ms(segments):
+    """Collect segment start/end times as integer millisecond arrays"""
+    # Single pass, so a generator of segments is consumed only once
+    times = np.array([(segment.start, segment.end) for segment in segments], dtype=np.float64).reshape(-1, 2)
+    times_ms = (times * 1000).astype(np.int64)
+    return times_ms[:, 0], times_ms[:, 1]
+
+def _split_ms(milliseconds):
+    """Break a millisecond array into hour, minute, second and millisecond lists"""
+    hours = milliseconds // 3_600_000
+    minutes = (milliseconds // 60_000) % 60
+    secs = (milliseconds // 1000) % 60
+    millis = milliseconds % 1000
+    return hours.tolist(), minutes.tolist(), secs.tolist(), millis.tolist()
+
+def ms_to_srt_times(milliseconds):
+    """Vectorized ms_to_srt_time over an array of milliseconds"""
+    return [f"{h:02d}:{m:02d}:{s:02d},{ms:03d}" for h, m, s, ms in zip(*_split_ms(milliseconds))]
+
+def _cache_is_fresh(cache_path, input_path):
+    """Return True if cache_path exists and is not older than input_path"""
+    return cache_path.exists() and cache_path.stat().st_mtime >= Path(input_path).stat().st_mtime
+
+def _temp_path_for(path):
+    """Create an empty temp file next to path, keeping its suffix, for an atomic os.replace later"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=path.suffix)
+    os.close(fd)
+    return Path(tmp_path)
+
+def load_audio(input_path, cache_path=None, sampling_rate=16000):
+    """Decode audio to 16kHz mono float32, reusing a cached .npy copy when given"""
+    cache_path = Path(cache_path) if cache_path is not None else None
+    if cache_path is not None and _cache_is_fresh(cache_path, input_path):
+        return np.load(cache_path)
+    from faster_whisper.audio import decode_audio
+    audio = decode_audio(str(input_path), sampling_rate=sampling_rate)
+    if cache_path is not None:
+        # Save under a temp name so an interrupted save never leaves a corrupt cache behind
+        tmp_path = _temp_path_for(cache_path)
+        try:
+            np.save(tmp_path, audio)
+            os.replace(tmp_path, cache_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return audio
+
+def ensure_wav(input_path, wav_path=None):
+    """Extract 16kHz mono PCM audio with ffmpeg once and return the cached WAV path"""
+    input_path = Path(input_path)
+    wav_path = Path(wav_path) if wav_path is not None else input_path.with_suffix(".16k.wav")
+    if _cache_is_fresh(wav_path, input_path):
+        return wav_path
+    print(f"Extracting audio to {wav_path}...")
+    # Extract under a temp name so a failed or interrupted run never leaves a truncated WAV behind
+    tmp_path = _temp_path_for(wav_path)
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-i", str(input_path),
+                "-vn",
+                "-ac", "1",
+                "-ar", "16000",
+                "-c:a", "pcm_s16le",
+                str(tmp_path),
+            ],
+            check=True,
+            capture_output=True
+        )
+        os.replace(tmp_path, wav_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return wav_path
+
+def write_outputs_streaming(segments, output_dir, base_name, on_segment=None, flush_interval=FLUSH_INTERVAL):
+    """Write TSV/SRT/VTT in a single pass as segments are decoded, then TXT once at the end (also on failure)
+
+    on_segment(i, segment, start_srt, end_srt) is called after each segment is written,
+    for progress reporting, logging or thermal checks. Returns the number of segments written.
+    """
+    output_dir = Path(output_dir)
+    # TXT is plain running text with no timestamps, so it is collected and written once at the end
+    txt_parts = []
+
+    # Truncate TXT up front with the other files, and write it in the finally even if decoding fails,
+    # so the directory never mixes a previous run's TXT with this run's partial TSV/SRT/VTT
+    txt_path = output_dir / f"{base_name}.txt"
+    txt_path.write_bytes(b"")
+    i = 0
+    try:
+        # Binary mode skips the TextIOWrapper layer; each segment is encoded to UTF-8 once per file
+        with open(output_dir / f"{base_name}.tsv", 'wb') as tsv_f, \
+             open(output_dir / f"{base_name}.srt", 'wb') as srt_f, \
+             open(output_dir / f"{base_name}.vtt", 'wb') as vtt_f:
+
+            tsv_f.write(b"start\tend\ttext\n")
+            vtt_f.write(b"WEBVTT\n\n")
+
+            for i, segment in enumerate(segments, 1):
+                text = segment.text.strip()
+                start_ms = int(segment.start * 1000)
+                end_ms = int(segment.end * 1000)
+
+                # Format each timestamp once; VTT only differs from SRT by the millisecond separator
+                start_srt = ms_to_srt_time(start_ms)
+                end_srt = ms_to_srt_time(end_ms)
+
+                txt_parts.append(text)
+                tsv_f.write(f"{start_ms}\t{end_ms}\t{text}\n".encode('utf-8'))
+                srt_f.write(f"{i}\n{start_srt} --> {end_srt}\n{text}\n\n".encode('utf-8'))
+                vtt_f.write(f"{start_srt.replace(',', '.')} --> {end_srt.replace(',', '.')}\n{text}\n\n".encode('utf-8'))
+
+                # Flush periodically so partial results survive a crash
+                if flush_interval and i % flush_interval == 0:
+                    for f in (tsv_f, srt_f, vtt_f):
+                        f.flush()
+
+                if on_segment is not None:
+                    on_segment(i, segment, start_srt, end_srt)
+    finally:
+        txt_path.write_text(" ".join(txt_parts), encoding='utf-8')
+    return i
+
+def save_txt(segments, filename):
+    """Save plain text transcription"""
+    Path(filename).write_text(" ".join(segment.text.strip() for segment in segments), encoding='utf-8')
+    print(f"Saved {filename}")
+
+def save_tsv(segments, filename):
+    """Save Tab-Separated Values with timestamps in milliseconds"""
+    # Accept the lazy generator from model.transcribe; it is iterated more than once below
+    segments = list(segments)
+    starts, ends = segments_to_ms(segments)
+    lines = ["start\tend\ttext\n"]
+    for start_ms, end_ms, segment in zip(starts.tolist(), ends.tolist(), segments):
+        lines.append(f"{start_ms}\t{end_ms}\t{segment.text.strip()}\n")
+    Path(filename).write_text("".join(lines), encoding='utf-8')
+    print(f"Saved {filename}")
+
+def save_srt(segments, filename):
+    """Save SubRip subtitle format"""
+    # Accept the lazy generator from model.transcribe; it is iterated more than once below
+    segments = list(segments)
+    starts, ends = segments_to_ms(segments)
+    lines = []
+    for i, (start_time, end_time, segment) in enumerate(zip(ms_to_srt_times(starts), ms_to_srt_times(ends), segments), 1):
+        lines.append(f"{i}\n{start_time} --> {end_time}\n{segment.text.strip()}\n\n")
+    Path(filename).write_text("".join(lines), encoding='utf-8')
+    print(f"Saved {filename}")
+
+def save_vtt(segments, filename):
+    """Save WebVTT subtitle format"""
+    # Accept the lazy generator from model.transcribe; it is iterated more than once below
+    segments = list(segments)
+    starts, ends = segments_to_ms(segments)
+    lines = ["WEBVTT\n\n"]
+    for start_time, end_time, segment in zip(ms_to_srt_times(starts), ms_to_srt_times(ends), segments):
+        # VTT timestamps are SRT timestamps with a period before the milliseconds
+        lines.append(f"{start_time.replace(',', '.')} --> {end_time.replace(',', '.')}\n{segment.text.strip()}\n\n")
+    Path(filename).write_text("".join(lines), encoding='utf-8')
+    print(f"Saved {filename}")